@@ -1,16 +1,91 @@
-from flask import Flask, request, jsonify
-from transformers import pipeline
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import JSONProvider
+import orjson
+from vllm import LLM, SamplingParams
 import torch
 import numpy as np
 from sklearn.ensemble import IsolationForest
 import joblib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Prebuilt TensorRT-LLM engine for gpt2. When present it is used instead of vLLM.
+# Build it once per GPU type with max_batch_size close to the real workload
+# (over-sizing it reserves activation memory that is never used):
+#   python convert_checkpoint.py --model_dir gpt2 --dtype float16 --output_dir gpt2_ckpt
+#       [--use_weight_only --weight_only_precision int8]
+#   trtllm-build --checkpoint_dir gpt2_ckpt --gemm_plugin float16 --max_batch_size 32 \
+#       --max_input_len 512 --max_output_len 500 --output_dir /app/engines/gpt2_fp16
+TRTLLM_ENGINE_DIR = os.environ.get('TRTLLM_ENGINE_DIR', '/app/engines/gpt2_fp16')
+TRTLLM_MAX_BATCH_SIZE = 32
+
+# Optional vLLM weight quantization (e.g. 'fp8'). Decode is bound by weight
+# bandwidth, so 8-bit weights roughly halve the bytes read per token.
+LLM_QUANTIZATION = os.environ.get('LLM_QUANTIZATION') or None
+
+# gpt2 saved as safetensors at image build time (see Dockerfile)
+GPT2_WEIGHTS_DIR = os.environ.get('GPT2_WEIGHTS_DIR', '/app/weights/gpt2')
+
+# Prompts per generate() call on the transformers backend
+HF_BATCH_SIZE = 8
+
+# Prompt tokens kept per request (gpt2's context is 1024, leaving room for 500 new tokens)
+MAX_INPUT_LEN = 512
+
+llm = None
+trt_runner = None
+hf_model = None
+tokenizer = None
 
 # Initialize models
 try:
-    # Large Language Model
-    llm = pipeline('text-generation', model='gpt2', max_length=500)
+    if os.path.isdir(TRTLLM_ENGINE_DIR):
+        # Fused FP16 TensorRT-LLM engine
+        from tensorrt_llm.runtime import ModelRunner
+        from transformers import AutoTokenizer
+        
+        tokenizer = AutoTokenizer.from_pretrained('gpt2')
+        trt_runner = ModelRunner.from_dir(engine_dir=TRTLLM_ENGINE_DIR)
+    elif torch.cuda.is_available():
+        # Large Language Model served by vLLM: PagedAttention shares the KV cache
+        # across concurrent sequences and continuously batches their decode steps
+        llm = LLM(
+            model='gpt2',
+            dtype='float16',
+            quantization=LLM_QUANTIZATION,
+            gpu_memory_utilization=0.9,
+            max_num_seqs=64
+        )
+    else:
+        # vLLM needs a GPU; on CPU nodes run transformers directly, one
+        # tokenize/generate/decode pass per batch instead of a pipeline loop
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        
+        tokenizer = AutoTokenizer.from_pretrained('gpt2')
+        tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = 'left'
+        tokenizer.truncation_side = 'left'
+        # Prefer the local copy saved at build time over a hub download
+        model_source = GPT2_WEIGHTS_DIR if os.path.isdir(GPT2_WEIGHTS_DIR) else 'gpt2'
+        hf_model = AutoModelForCausalLM.from_pretrained(model_source).eval()
+        
+        # Compile forward (which generate() calls on every decode step) into fused
+        # kernels; sequence length grows each step, so compile for dynamic shapes
+        torch.set_float32_matmul_precision('high')
+        hf_model.forward = torch.compile(hf_model.forward, dynamic=True)
     
     # Specialized models
     # For demonstration, we'll use simple models
@@ -24,6 +99,86 @@ try:
 except Exception as e:
     print(f"Error loading models: {e}")
     llm = None
+    trt_runner = None
+    hf_model = None
+
+# Anomaly detection model saved by /model/train. Prediction reuses this
+# prefit forest instead of fitting a new one on every request.
+ANOMALY_MODEL_PATH = '/app/models/anomaly_detection_model.pkl'
+anomaly_model_lock = threading.Lock()
+
+try:
+    anomaly_model = joblib.load(ANOMALY_MODEL_PATH)
+except Exception:
+    anomaly_model = None
+
+def get_anomaly_model(X):
+    """Return the cached anomaly model, fitting it once on X if none was trained"""
+    global anomaly_model
+    if anomaly_model is None:
+        with anomaly_model_lock:
+            if anomaly_model is None:
+                model = IsolationForest(contamination=0.1)
+                model.fit(X)
+                anomaly_model = model
+    return anomaly_model
+
+def llm_available():
+    """Check whether any LLM backend was loaded"""
+    return trt_runner is not None or llm is not None or hf_model is not None
+
+# Werkzeug serves requests on many threads, but none of the LLM backends may be
+# driven concurrently: every generate() call runs on this one thread instead
+generation_executor = ThreadPoolExecutor(max_workers=1)
+
+def generate_texts(prompts, max_tokens=500):
+    """Generate a completion for each prompt, returned as prompt + completion"""
+    return generation_executor.submit(run_generation, prompts, max_tokens).result()
+
+def run_generation(prompts, max_tokens):
+    """Run the loaded LLM backend on a batch; only called on the generation thread"""
+    if trt_runner is not None:
+        completions = []
+        for start in range(0, len(prompts), TRTLLM_MAX_BATCH_SIZE):
+            chunk = prompts[start:start + TRTLLM_MAX_BATCH_SIZE]
+            batch_input_ids = [
+                torch.tensor(tokenizer.encode(p)[-MAX_INPUT_LEN:], dtype=torch.int32)
+                for p in chunk
+            ]
+            with torch.inference_mode():
+                output_ids = trt_runner.generate(
+                    batch_input_ids,
+                    max_new_tokens=max_tokens,
+                    end_id=tokenizer.eos_token_id,
+                    pad_id=tokenizer.eos_token_id
+                )
+            for i, input_ids in enumerate(batch_input_ids):
+                new_tokens = output_ids[i][0][len(input_ids):]
+                completions.append(tokenizer.decode(new_tokens, skip_special_tokens=True))
+    elif hf_model is not None:
+        # Tokenize once, then batch prompts of similar length to minimize padding
+        input_ids = tokenizer(prompts, truncation=True, max_length=MAX_INPUT_LEN)['input_ids']
+        order = np.argsort([len(ids) for ids in input_ids], kind='stable')
+        
+        sorted_completions = []
+        for start in range(0, len(prompts), HF_BATCH_SIZE):
+            batch = [{'input_ids': input_ids[i]} for i in order[start:start + HF_BATCH_SIZE]]
+            inputs = tokenizer.pad(batch, padding='longest', return_tensors='pt').to(hf_model.device)
+            with torch.inference_mode():
+                output_ids = hf_model.generate(
+                    **inputs, max_new_tokens=max_tokens, pad_token_id=tokenizer.eos_token_id
+                )
+            # Left padding aligns every prompt to the same width, so new tokens start there
+            new_tokens = output_ids[:, inputs['input_ids'].shape[1]:]
+            sorted_completions.extend(tokenizer.batch_decode(new_tokens, skip_special_tokens=True))
+        
+        # Restore request order
+        completions = [sorted_completions[i] for i in np.argsort(order)]
+    else:
+        outputs = llm.generate(prompts, SamplingParams(max_tokens=max_tokens))
+        completions = [output.outputs[0].text for output in outputs]
+    
+    return [prompt + completion for prompt, completion in zip(prompts, completions)]
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -31,7 +186,7 @@ def health():
 
 @app.route('/llm/generate', methods=['POST'])
 def use_llm():
-    if not llm:
+    if not llm_available():
         return jsonify({"error": "LLM not available"}), 500
     
     try:
@@ -43,8 +198,7 @@ def use_llm():
             return jsonify({"error": "Prompt is required"}), 400
         
         # Generate text
-        response = llm(prompt, max_length=500, num_return_sequences=1)
-        generated_text = response[0]['generated_text']
+        generated_text = generate_texts([prompt])[0]
         
         return jsonify({
             "prompt": prompt,
@@ -58,7 +212,7 @@ def use_llm():
 
 @app.route('/llm/batch-generate', methods=['POST'])
 def batch_llm_generate():
-    if not llm:
+    if not llm_available():
         return jsonify({"error": "LLM not available"}), 500
     
     try:
@@ -68,12 +222,13 @@ def batch_llm_generate():
         if not prompts:
             return jsonify({"error": "Prompts array is required"}), 400
         
+        # Submit every prompt in one call so the engine batches prefill and decode
+        generated_texts = generate_texts(prompts)
         results = []
-        for prompt in prompts:
-            response = llm(prompt, max_length=500, num_return_sequences=1)
+        for prompt, generated_text in zip(prompts, generated_texts):
             results.append({
                 "prompt": prompt,
-                "generated_text": response[0]['generated_text']
+                "generated_text": generated_text
             })
         
         return jsonify({
@@ -103,26 +258,26 @@ def specialized_predict():
                 return jsonify({"error": "Features array is required"}), 400
             
             # Reshape for sklearn
-            X = np.array(features).reshape(-1, 1)
+            X = np.asarray(features, dtype=np.float32).reshape(-1, 1)
             
-            # Train or load model
-            model = IsolationForest(contamination=0.1)
-            model.fit(X)
+            model = get_anomaly_model(X)
             
             # Predict
             predictions = model.predict(X)
             anomaly_scores = model.decision_function(X)
             
-            return jsonify({
+            # Serialize the arrays directly instead of converting them to Python lists
+            payload = {
                 "model_type": model_type,
-                "predictions": predictions.tolist(),
-                "anomaly_scores": anomaly_scores.tolist(),
+                "predictions": predictions,
+                "anomaly_scores": anomaly_scores,
                 "status": "success"
-            })
+            }
+            return Response(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), mimetype='application/json')
         
         elif model_type == 'text_classification':
             # Simple text classification using LLM
-            if not llm:
+            if not llm_available():
                 return jsonify({"error": "LLM not available"}), 500
             
             text = input_data.get('text', '')
@@ -131,12 +286,12 @@ def specialized_predict():
             
             # Generate classification prompt
             classification_prompt = f"Classify the following text as positive, negative, or neutral: '{text}'"
-            response = llm(classification_prompt, max_length=100, num_return_sequences=1)
+            classification = generate_texts([classification_prompt], max_tokens=100)[0]
             
             return jsonify({
                 "model_type": model_type,
                 "text": text,
-                "classification": response[0]['generated_text'],
+                "classification": classification,
                 "status": "success"
             })
         
@@ -163,15 +318,20 @@ def train_model():
             if not features:
                 return jsonify({"error": "Features array is required"}), 400
             
-            X = np.array(features).reshape(-1, 1)
+            X = np.asarray(features, dtype=np.float32).reshape(-1, 1)
             model = IsolationForest(contamination=0.1)
             model.fit(X)
             
             # Save model
-            model_path = f"/app/models/anomaly_detection_model.pkl"
+            model_path = ANOMALY_MODEL_PATH
             os.makedirs(os.path.dirname(model_path), exist_ok=True)
             joblib.dump(model, model_path)
             
+            # Serve predictions from the newly trained model
+            global anomaly_model
+            with anomaly_model_lock:
+                anomaly_model = model
+            
             return jsonify({
                 "model_type": model_type,
                 "model_path": model_path,
@@ -1,11 +1,33 @@
-from flask import Flask, request, jsonify
+# Patch blocking I/O first so upstream calls yield to other requests under gevent
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import JSONProvider
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+import redis
+import os
 import time
 import logging
+import threading
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from datetime import datetime
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,34 +44,113 @@ SERVICES = {
     'data-processing': 'http://data-processing-service:8006'
 }
 
-# Rate limiting storage
-rate_limits = {}
+# Upstream request timeout in seconds
+UPSTREAM_TIMEOUT = 30
+HEALTH_CHECK_TIMEOUT = 2
+
+# Shared keep-alive connection pool for upstream calls
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=100, pool_maxsize=100, max_retries=0))
+
+# Chunk size used when relaying upstream bodies to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Headers that describe the incoming connection/body rather than the forwarded request
+SKIP_FORWARD_HEADERS = {'host', 'content-length'}
+
+# Upstream response headers passed back to the client, so it can cache them
+RELAY_HEADERS = ('Cache-Control', 'ETag')
+
+# Fan-out pool for endpoints that query several services at once
+fanout_executor = ThreadPoolExecutor(max_workers=len(SERVICES))
+
+# Rate limiting storage, shared by all gateway replicas
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+RATE_LIMIT_PREFIX = 'rl:'
+redis_client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+
+# After a Redis error the limiter skips Redis for this long and goes straight
+# to the local store, instead of waiting out the socket timeout per request
+REDIS_RETRY_INTERVAL = 10
+redis_retry_at = 0.0
+
+def redis_available():
+    """Whether Redis should be tried, i.e. no recent error has tripped the breaker"""
+    return time.monotonic() >= redis_retry_at
+
+def mark_redis_unavailable(error):
+    """Skip Redis for REDIS_RETRY_INTERVAL seconds after an error"""
+    global redis_retry_at
+    redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.warning(f"Rate limiter falling back to local store for {REDIS_RETRY_INTERVAL}s: {error}")
+
+# Per-process fallback used while Redis is unreachable. It keeps the same
+# fixed-window counters under the same keys as Redis; entries are bounded and
+# expire after twice the longest rate limit window.
+LOCAL_RATE_LIMIT_TTL = 120
+local_rate_limits = TTLCache(maxsize=100_000, ttl=LOCAL_RATE_LIMIT_TTL)
+local_rate_limits_lock = threading.Lock()
+
+def local_rate_limit_exceeded(key, max_requests):
+    """Fixed-window rate limit check against the in-process fallback store"""
+    with local_rate_limits_lock:
+        count = local_rate_limits.get(key, 0) + 1
+        local_rate_limits[key] = count
+        return count > max_requests
 
 def rate_limit(max_requests=100, window_seconds=60):
-    """Simple rate limiting decorator"""
+    """Fixed-window rate limiting decorator backed by a Redis counter per client and window"""
     def decorator(f):
         @wraps(f)
         def decorated(*args, **kwargs):
             client_ip = request.remote_addr
+            window = int(time.time() // window_seconds)
+            key = f"{RATE_LIMIT_PREFIX}{client_ip}:{window}"
             
-            if client_ip not in rate_limits:
-                rate_limits[client_ip] = []
+            # Count the request and set the expiry only when the key is created
+            exceeded = None
+            if redis_available():
+                try:
+                    pipe = redis_client.pipeline()
+                    pipe.incr(key)
+                    pipe.expire(key, window_seconds, nx=True)
+                    count, _ = pipe.execute()
+                    exceeded = count > max_requests
+                except redis.exceptions.RedisError as e:
+                    mark_redis_unavailable(e)
             
-            # Clean old requests
-            now = time.time()
-            rate_limits[client_ip] = [req_time for req_time in rate_limits[client_ip] if now - req_time < window_seconds]
+            if exceeded is None:
+                exceeded = local_rate_limit_exceeded(key, max_requests)
             
             # Check rate limit
-            if len(rate_limits[client_ip]) >= max_requests:
+            if exceeded:
                 return jsonify({"error": "Rate limit exceeded"}), 429
             
-            # Add current request
-            rate_limits[client_ip].append(now)
-            
             return f(*args, **kwargs)
         return decorated
     return decorator
 
+def rate_limit_stats():
+    """Summarize the live rate limit counters"""
+    try:
+        if not redis_available():
+            raise redis.exceptions.ConnectionError("Redis skipped after a recent error")
+        keys = list(redis_client.scan_iter(match=f"{RATE_LIMIT_PREFIX}*", count=1000))
+        counts = [int(count) for count in redis_client.mget(keys) if count is not None] if keys else []
+        return {
+            "backend": "redis",
+            "active_clients": len({key.rsplit(b':', 1)[0] for key in keys}),
+            "total_requests": sum(counts)
+        }
+    except redis.exceptions.RedisError:
+        with local_rate_limits_lock:
+            entries = list(local_rate_limits.items())
+        return {
+            "backend": "local",
+            "active_clients": len({key.rsplit(':', 1)[0] for key, _ in entries}),
+            "total_requests": sum(count for _, count in entries)
+        }
+
 def log_request(f):
     """Log incoming requests"""
     @wraps(f)
@@ -58,7 +159,7 @@ def log_request(f):
         
         try:
             result = f(*args, **kwargs)
-            status_code = result[1] if isinstance(result, tuple) else 200
+            status_code = result[1] if isinstance(result, tuple) else getattr(result, 'status_code', 200)
         except Exception as e:
             status_code = 500
             result = jsonify({"error": str(e)})
@@ -70,6 +171,35 @@ def log_request(f):
         return result
     return decorated
 
+def call_service(method, service, path, **kwargs):
+    """Send a request to a microservice"""
+    kwargs.setdefault('timeout', UPSTREAM_TIMEOUT)
+    return session.request(method, f"{SERVICES[service]}/{path}", **kwargs)
+
+def relay_response(response):
+    """Stream an upstream response back to the client without re-encoding it"""
+    def generate():
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            response.close()
+    
+    return Response(
+        generate(),
+        status=response.status_code,
+        content_type=response.headers.get('Content-Type', 'application/json'),
+        headers={name: response.headers[name] for name in RELAY_HEADERS if name in response.headers}
+    )
+
+def check_service_health(service):
+    """Return whether a microservice answers its health check"""
+    try:
+        response = call_service('GET', service, 'health', timeout=HEALTH_CHECK_TIMEOUT)
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "healthy", "service": "api-gateway"})
@@ -82,26 +212,22 @@ def proxy_request(service, endpoint):
     if service not in SERVICES:
         return jsonify({"error": f"Service '{service}' not found"}), 404
     
-    service_url = f"{SERVICES[service]}/{endpoint}"
-    
     try:
         # Forward headers
-        headers = {key: value for key, value in request.headers if key.lower() != 'host'}
+        headers = {key: value for key, value in request.headers if key.lower() not in SKIP_FORWARD_HEADERS}
         
         # Forward request to service
         if request.method == 'GET':
-            response = requests.get(service_url, params=request.args, headers=headers)
-        elif request.method == 'POST':
-            response = requests.post(service_url, json=request.json, headers=headers)
-        elif request.method == 'PUT':
-            response = requests.put(service_url, json=request.json, headers=headers)
+            response = call_service('GET', service, endpoint, params=request.args, headers=headers, stream=True)
+        elif request.method in ('POST', 'PUT'):
+            response = call_service(request.method, service, endpoint, json=request.json, headers=headers, stream=True)
         elif request.method == 'DELETE':
-            response = requests.delete(service_url, headers=headers)
+            response = call_service('DELETE', service, endpoint, headers=headers, stream=True)
         else:
             return jsonify({"error": "Method not allowed"}), 405
         
-        # Return response
-        return jsonify(response.json()), response.status_code
+        # Relay the upstream body as-is instead of parsing and re-serializing it
+        return relay_response(response)
         
     except requests.exceptions.ConnectionError:
         return jsonify({"error": f"Service '{service}' is unavailable"}), 503
@@ -117,8 +243,8 @@ def generate_text():
     """Generate text using the text generation service"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['text-generation']}/generate", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'text-generation', 'generate', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -129,8 +255,8 @@ def generate_image():
     """Generate image using the image generation service"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['image-generation']}/generate", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'image-generation', 'generate', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -141,8 +267,25 @@ def generate_video():
     """Generate video using the video generation service"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['video-generation']}/generate", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'video-generation', 'generate', json=data, stream=True)
+        return relay_response(response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/v1/video/result/<job_id>', methods=['GET'])
+@rate_limit(max_requests=100, window_seconds=60)
+@log_request
+def get_video_result(job_id):
+    """Fetch a rendered video (or its job status) from the video generation service"""
+    try:
+        # Pass the client's ETag through so an unchanged video comes back as a 304
+        headers = {}
+        if 'If-None-Match' in request.headers:
+            headers['If-None-Match'] = request.headers['If-None-Match']
+        response = call_service(
+            'GET', 'video-generation', f'result/{job_id}', params=request.args, headers=headers, stream=True
+        )
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -153,8 +296,8 @@ def generate_llm():
     """Generate text using large language models"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['ai-models']}/llm/generate", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'ai-models', 'llm/generate', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -165,8 +308,8 @@ def create_app():
     """Create a new no-code app"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['no-code-development']}/create-app", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'no-code-development', 'create-app', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -177,8 +320,8 @@ def create_workflow():
     """Create a new workflow"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['no-code-development']}/create-workflow", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'no-code-development', 'create-workflow', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -189,8 +332,8 @@ def register_user():
     """Register a new user"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['security']}/register", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'security', 'register', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -201,8 +344,8 @@ def login_user():
     """Authenticate user and return JWT token"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['security']}/login", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'security', 'login', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -213,8 +356,8 @@ def ingest_data():
     """Ingest data for processing"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['data-processing']}/ingest", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'data-processing', 'ingest', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -225,8 +368,8 @@ def start_stream_processing():
     """Start stream processing"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['data-processing']}/stream/process", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'data-processing', 'stream/process', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -237,8 +380,8 @@ def encrypt_data():
     """Encrypt data using security service"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['security']}/encrypt", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'security', 'encrypt', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -249,8 +392,8 @@ def decrypt_data():
     """Decrypt data using security service"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['security']}/decrypt", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'security', 'decrypt', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -261,8 +404,8 @@ def create_protocol():
     """Create a custom security protocol"""
     try:
         data = request.json
-        response = requests.post(f"{SERVICES['security']}/create-protocol", json=data)
-        return jsonify(response.json()), response.status_code
+        response = call_service('POST', 'security', 'create-protocol', json=data, stream=True)
+        return relay_response(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -271,14 +414,16 @@ def create_protocol():
 def get_metrics():
     """Get gateway metrics"""
     try:
+        # Check every service concurrently so the slowest one bounds the latency
+        service_names = list(SERVICES)
+        health = fanout_executor.map(check_service_health, service_names)
+        
         return jsonify({
             "service": "api-gateway",
             "timestamp": datetime.utcnow().isoformat(),
-            "rate_limits": {
-                "active_clients": len(rate_limits),
-                "total_requests": sum(len(requests) for requests in rate_limits.values())
-            },
-            "services": SERVICES
+            "rate_limits": rate_limit_stats(),
+            "services": SERVICES,
+            "service_health": dict(zip(service_names, health))
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
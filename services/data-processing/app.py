@@ -1,16 +1,56 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
+import orjson
 import json
 import time
+import hashlib
+import functools
 from datetime import datetime
+import os
 import threading
-import queue
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numba import njit
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # In-memory storage for demonstration
-data_queue = queue.Queue()
-processed_data = []
+# Ingest queue: producers appendleft() and consumers pop(), both atomic on a
+# deque, with an Event to wake idle consumers instead of a lock per operation
+data_queue = deque()
+data_available = threading.Event()
+
+# Most recent results only; the oldest are dropped once the buffer is full
+PROCESSED_DATA_CAPACITY = 100_000
+processed_data = deque(maxlen=PROCESSED_DATA_CAPACITY)
 stream_processors = {}
+stream_processors_lock = threading.Lock()
+
+# Compiled ETL pipelines keyed by a digest of their step definitions
+compiled_etl_pipelines = {}
+COMPILED_ETL_PIPELINES_LIMIT = 1024
+
+# Messages a stream consumer drains from the ingest queue per iteration
+STREAM_BATCH_SIZE = 64
+
+# Default number of consumer threads per stream processor; requested counts
+# are clamped to 1..MAX_STREAM_WORKERS. Consumers mostly wait on the queue, so
+# a few per core are fine; the ceiling only stops a single request from
+# starting thousands of threads
+DEFAULT_STREAM_WORKERS = os.cpu_count() or 4
+MAX_STREAM_WORKERS = int(os.environ.get('MAX_STREAM_WORKERS', 4 * (os.cpu_count() or 4)))
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -36,12 +76,13 @@ def ingest_data():
             'source': request.remote_addr
         }
         
-        data_queue.put(message)
+        data_queue.appendleft(message)
+        data_available.set()
         
         return jsonify({
             "message_id": message['id'],
             "status": "ingested",
-            "queue_size": data_queue.qsize()
+            "queue_size": len(data_queue)
         })
         
     except Exception as e:
@@ -55,25 +96,32 @@ def start_stream_processing():
         processor_id = data.get('processor_id', f"processor_{int(time.time())}")
         config = data.get('config', {})
         
+        try:
+            workers = int(config.get('workers', DEFAULT_STREAM_WORKERS))
+        except (TypeError, ValueError):
+            return jsonify({"error": "workers must be an integer"}), 400
+        workers = min(max(workers, 1), MAX_STREAM_WORKERS)
+        
         if processor_id in stream_processors:
             return jsonify({"error": f"Processor {processor_id} already exists"}), 409
         
-        # Start processing thread
-        processor_thread = threading.Thread(
-            target=process_stream,
-            args=(processor_id, config),
-            daemon=True
-        )
-        processor_thread.start()
+        # Start a fixed pool of consumers sharing one stop signal
+        stop_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=processor_id)
         
         stream_processors[processor_id] = {
-            'thread': processor_thread,
+            'executor': executor,
+            'stop': stop_event,
             'status': 'running',
             'config': config,
+            'workers': workers,
             'processed_count': 0,
             'start_time': datetime.utcnow().isoformat()
         }
         
+        for _ in range(workers):
+            executor.submit(process_stream, processor_id, config, stop_event)
+        
         return jsonify({
             "processor_id": processor_id,
             "status": "started",
@@ -90,7 +138,10 @@ def stop_stream_processing(processor_id):
         if processor_id not in stream_processors:
             return jsonify({"error": f"Processor {processor_id} not found"}), 404
         
-        stream_processors[processor_id]['status'] = 'stopped'
+        processor = stream_processors[processor_id]
+        processor['status'] = 'stopped'
+        processor['stop'].set()
+        processor['executor'].shutdown(wait=False)
         
         return jsonify({
             "processor_id": processor_id,
@@ -104,9 +155,17 @@ def stop_stream_processing(processor_id):
 def get_stream_status():
     """Get status of all stream processors"""
     try:
+        processors = {
+            processor_id: {
+                key: value for key, value in processor.items()
+                if key not in ('executor', 'stop')
+            }
+            for processor_id, processor in stream_processors.items()
+        }
+        
         return jsonify({
-            "processors": stream_processors,
-            "queue_size": data_queue.qsize(),
+            "processors": processors,
+            "queue_size": len(data_queue),
             "processed_count": len(processed_data)
         })
         
@@ -120,7 +179,10 @@ def get_stream_results():
         limit = request.args.get('limit', 100, type=int)
         offset = request.args.get('offset', 0, type=int)
         
-        results = processed_data[offset:offset + limit]
+        if limit < 0 or offset < 0:
+            return jsonify({"error": "Limit and offset must be non-negative"}), 400
+        
+        results = list(itertools.islice(processed_data, offset, offset + limit))
         
         return jsonify({
             "results": results,
@@ -178,61 +240,78 @@ def transform_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def process_stream(processor_id, config):
-    """Process data stream in background"""
-    while True:
-        try:
-            # Check if processor should stop
-            if stream_processors.get(processor_id, {}).get('status') == 'stopped':
+def process_stream(processor_id, config, stop_event):
+    """Consume messages from the ingest queue until the processor is stopped"""
+    while not stop_event.is_set():
+        # Drain up to a batch of messages at once
+        batch = []
+        while len(batch) < STREAM_BATCH_SIZE:
+            try:
+                batch.append(data_queue.pop())
+            except IndexError:
                 break
-            
-            # Get data from queue
-            if not data_queue.empty():
-                message = data_queue.get(timeout=1)
-                
+        
+        if not batch:
+            # Sleep until a message arrives; the timeout only bounds how long a stop takes
+            data_available.wait(timeout=1)
+            data_available.clear()
+            continue
+        
+        # One timestamp for the whole batch
+        processed_at = datetime.utcnow().isoformat()
+        
+        results = []
+        for message in batch:
+            try:
                 # Process the message
-                processed_message = {
+                results.append({
                     'original_id': message['id'],
                     'processor_id': processor_id,
-                    'processed_data': apply_stream_processing(message['data'], config),
-                    'processed_at': datetime.utcnow().isoformat()
-                }
-                
-                # Store result
-                processed_data.append(processed_message)
-                
-                # Update counter
-                if processor_id in stream_processors:
-                    stream_processors[processor_id]['processed_count'] += 1
-                
-                data_queue.task_done()
-            else:
-                time.sleep(0.1)  # Small delay to prevent busy waiting
-                
-        except queue.Empty:
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"Error in stream processor {processor_id}: {e}")
-            time.sleep(1)
+                    'processed_data': apply_stream_processing(message['data'], config, processed_at),
+                    'processed_at': processed_at
+                })
+            except Exception as e:
+                print(f"Error in stream processor {processor_id}: {e}")
+        
+        # Store results
+        processed_data.extend(results)
+        
+        # Update counter
+        with stream_processors_lock:
+            if processor_id in stream_processors:
+                stream_processors[processor_id]['processed_count'] += len(results)
 
 def execute_etl_pipeline(steps):
     """Execute ETL pipeline steps"""
-    result = {}
+    key = hashlib.blake2b(json.dumps(steps, sort_keys=True).encode('utf-8')).digest()
+    
+    pipeline = compiled_etl_pipelines.get(key)
+    if pipeline is None:
+        pipeline = compile_etl_pipeline(steps)
+        if len(compiled_etl_pipelines) >= COMPILED_ETL_PIPELINES_LIMIT:
+            compiled_etl_pipelines.clear()
+        compiled_etl_pipelines[key] = pipeline
     
-    for step in steps:
-        step_type = step.get('type', '')
-        step_config = step.get('config', {})
-        
-        if step_type == 'extract':
-            result = extract_data(step_config)
-        elif step_type == 'transform':
-            result = transform_data_step(result, step_config)
-        elif step_type == 'load':
-            result = load_data(result, step_config)
-        else:
-            raise ValueError(f"Unknown ETL step type: {step_type}")
+    return pipeline({})
+
+def compile_etl_pipeline(steps):
+    """Compose the step functions of a pipeline into a single callable"""
+    step_functions = [compile_etl_step(step) for step in steps]
+    return functools.reduce(lambda f, g: lambda data: g(f(data)), step_functions)
+
+def compile_etl_step(step):
+    """Resolve a step definition to a function of the running result"""
+    step_type = step.get('type', '')
+    step_config = step.get('config', {})
     
-    return result
+    if step_type == 'extract':
+        return lambda data: extract_data(step_config)
+    elif step_type == 'transform':
+        return compile_transform_step(step_config)
+    elif step_type == 'load':
+        return compile_load_step(step_config)
+    else:
+        raise ValueError(f"Unknown ETL step type: {step_type}")
 
 def extract_data(config):
     """Extract data from various sources"""
@@ -253,47 +332,57 @@ def extract_data(config):
     else:
         return {"source": source_type, "data": {}}
 
-def transform_data_step(data, config):
-    """Transform extracted data"""
+def compile_transform_step(config):
+    """Resolve a transform step to its transformation function"""
     transform_type = config.get('transform_type', 'filter')
     
     if transform_type == 'filter':
-        # Simple filter transformation
-        filtered_data = {k: v for k, v in data.items() if k != 'sensitive_data'}
-        return filtered_data
+        return filter_sensitive_data
     elif transform_type == 'aggregate':
-        # Simple aggregation
-        if isinstance(data, dict) and 'data' in data:
-            items = data['data']
-            if isinstance(items, list):
-                total = sum(item.get('amount', 0) for item in items)
-                return {"aggregated_total": total, "count": len(items)}
-        return data
+        return aggregate_amounts
     else:
+        return lambda data: data
+
+def filter_sensitive_data(data):
+    """Drop the sensitive_data field, copying only when it is present"""
+    if 'sensitive_data' not in data:
         return data
+    return {k: v for k, v in data.items() if k != 'sensitive_data'}
+
+def aggregate_amounts(data):
+    """Sum the amount of every extracted item"""
+    if isinstance(data, dict) and 'data' in data:
+        items = data['data']
+        if isinstance(items, list):
+            total = sum(item.get('amount', 0) for item in items)
+            return {"aggregated_total": total, "count": len(items)}
+    return data
 
-def load_data(data, config):
-    """Load transformed data to destination"""
+def compile_load_step(config):
+    """Resolve a load step to the function writing to its destination"""
     destination_type = config.get('destination_type', 'memory')
     
     if destination_type == 'memory':
-        # Store in memory
-        processed_data.append({
-            'loaded_data': data,
-            'loaded_at': datetime.utcnow().isoformat(),
-            'destination': 'memory'
-        })
-        return {"status": "loaded", "destination": "memory"}
+        return load_to_memory
     else:
-        return {"status": "completed", "destination": destination_type}
+        return lambda data: {"status": "completed", "destination": destination_type}
+
+def load_to_memory(data):
+    """Load transformed data into the in-memory result store"""
+    processed_data.append({
+        'loaded_data': data,
+        'loaded_at': datetime.utcnow().isoformat(),
+        'destination': 'memory'
+    })
+    return {"status": "loaded", "destination": "memory"}
 
-def apply_stream_processing(data, config):
+def apply_stream_processing(data, config, timestamp):
     """Apply stream processing logic"""
     # Simple stream processing simulation
     processed = {
         'original_data': data,
         'processing_config': config,
-        'timestamp': datetime.utcnow().isoformat(),
+        'timestamp': timestamp,
         'processed': True
     }
     
@@ -306,16 +395,27 @@ def apply_stream_processing(data, config):
     
     return processed
 
+@njit(cache=True, fastmath=True)
+def normalize_kernel(values):
+    """Scale positive values by 1/100 and clamp the rest to zero"""
+    out = np.empty_like(values)
+    for i in range(values.size):
+        out[i] = values[i] / 100.0 if values[i] > 0 else 0.0
+    return out
+
+# Compile the kernel at import instead of on the first request
+normalize_kernel(np.zeros(1))
+
 def apply_transformation(data, transformation_type):
     """Apply data transformation"""
     if transformation_type == 'normalize':
-        # Normalize numerical values
-        normalized = {}
-        for key, value in data.items():
-            if isinstance(value, (int, float)):
-                normalized[key] = value / 100.0 if value > 0 else 0
-            else:
-                normalized[key] = value
+        # Normalize numerical values in a single vectorized pass
+        keys = [key for key, value in data.items() if isinstance(value, (int, float))]
+        values = np.fromiter((data[key] for key in keys), dtype=np.float64, count=len(keys))
+        values = normalize_kernel(values)
+        
+        normalized = dict(data)
+        normalized.update(zip(keys, values.tolist()))
         return normalized
     
     elif transformation_type == 'encode':
@@ -1,14 +1,56 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, abort
+from flask.json.provider import JSONProvider
+import orjson
 import json
 import uuid
 import yaml
+import ahocorasick
 from datetime import datetime
+from collections import defaultdict
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Request bodies larger than this are rejected with 413 before being read
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+@app.before_request
+def limit_request_size():
+    if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+        abort(413)
+
+def read_json():
+    """Parse the JSON request body with orjson, without caching the raw bytes"""
+    return orjson.loads(request.get_data(cache=False))
 
 # In-memory storage for apps and workflows
 apps_store = {}
 workflows_store = {}
+# app_id -> {workflow_id: workflow}, for listing an app's workflows without a scan
+app_workflows_index = defaultdict(dict)
+
+# Keywords that select app and workflow templates, matched in a single pass
+# over the description
+TEMPLATE_KEYWORDS = ("social media", "e-commerce", "influence", "automation")
+
+keyword_automaton = ahocorasick.Automaton()
+for keyword in TEMPLATE_KEYWORDS:
+    keyword_automaton.add_word(keyword, keyword)
+keyword_automaton.make_automaton()
+
+def match_keywords(description):
+    """Return the set of template keywords found in the description"""
+    return {keyword for _, keyword in keyword_automaton.iter(description.lower())}
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -18,7 +60,7 @@ def health():
 def create_app():
     """Create a new no-code app from description"""
     try:
-        data = request.json
+        data = read_json()
         description = data.get('description', '')
         app_name = data.get('name', f"App_{uuid.uuid4().hex[:8]}")
         
@@ -29,13 +71,14 @@ def create_app():
         app_structure = generate_app_structure(description)
         
         app_id = str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
         app_data = {
             "id": app_id,
             "name": app_name,
             "description": description,
             "structure": app_structure,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
+            "created_at": now,
+            "updated_at": now
         }
         
         apps_store[app_id] = app_data
@@ -79,7 +122,7 @@ def list_apps():
 def create_workflow():
     """Create a new workflow"""
     try:
-        data = request.json
+        data = read_json()
         app_id = data.get('app_id', '')
         workflow_description = data.get('description', '')
         workflow_name = data.get('name', f"Workflow_{uuid.uuid4().hex[:8]}")
@@ -94,17 +137,19 @@ def create_workflow():
         workflow_structure = generate_workflow_structure(workflow_description)
         
         workflow_id = str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
         workflow_data = {
             "id": workflow_id,
             "name": workflow_name,
             "app_id": app_id,
             "description": workflow_description,
             "structure": workflow_structure,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
+            "created_at": now,
+            "updated_at": now
         }
         
         workflows_store[workflow_id] = workflow_data
+        app_workflows_index[app_id][workflow_id] = workflow_data
         
         return jsonify({
             "workflow_id": workflow_id,
@@ -137,9 +182,10 @@ def list_workflows():
         # Filter by app_id if provided
         app_id = request.args.get('app_id')
         
-        workflows = list(workflows_store.values())
         if app_id:
-            workflows = [w for w in workflows if w.get('app_id') == app_id]
+            workflows = list(app_workflows_index.get(app_id, {}).values())
+        else:
+            workflows = list(workflows_store.values())
         
         return jsonify({
             "workflows": workflows,
@@ -157,7 +203,7 @@ def execute_workflow(workflow_id):
         if not workflow_data:
             return jsonify({"error": "Workflow not found"}), 404
         
-        data = request.json
+        data = read_json()
         input_data = data.get('input_data', {})
         
         # Execute workflow steps
@@ -172,176 +218,193 @@ def execute_workflow(workflow_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# App and workflow templates. The generated structures are only read and
+# serialized, never mutated, so every app and workflow shares these objects
+# instead of rebuilding them per request.
+APP_DATA_SOURCES = [
+    {"id": "local_storage", "type": "local", "name": "Local Storage"},
+    {"id": "api", "type": "rest", "url": "https://api.example.com/data"}
+]
+
+SOCIAL_MEDIA_APP_STRUCTURE = {
+    "pages": [
+        {"id": "dashboard", "name": "Dashboard", "type": "dashboard"},
+        {"id": "posts", "name": "Posts", "type": "list"},
+        {"id": "analytics", "name": "Analytics", "type": "chart"}
+    ],
+    "components": [
+        {"type": "button", "text": "Create Post"},
+        {"type": "input", "placeholder": "Search posts"},
+        {"type": "chart", "type": "bar"}
+    ],
+    "data_sources": APP_DATA_SOURCES,
+    "events": []
+}
+
+ECOMMERCE_APP_STRUCTURE = {
+    "pages": [
+        {"id": "home", "name": "Home", "type": "landing"},
+        {"id": "products", "name": "Products", "type": "grid"},
+        {"id": "cart", "name": "Cart", "type": "form"}
+    ],
+    "components": [
+        {"type": "button", "text": "Add to Cart"},
+        {"type": "input", "placeholder": "Search products"},
+        {"type": "image-gallery"}
+    ],
+    "data_sources": APP_DATA_SOURCES,
+    "events": []
+}
+
+GENERIC_APP_STRUCTURE = {
+    "pages": [
+        {"id": "main", "name": "Main", "type": "form"},
+        {"id": "list", "name": "List", "type": "list"}
+    ],
+    "components": [
+        {"type": "button", "text": "Submit"},
+        {"type": "input", "placeholder": "Enter text"},
+        {"type": "text-display"}
+    ],
+    "data_sources": APP_DATA_SOURCES,
+    "events": []
+}
+
+SOCIAL_MEDIA_WORKFLOW_STEPS = [
+    {
+        "id": "1",
+        "type": "api_call",
+        "name": "Fetch Social Media Data",
+        "config": {
+            "method": "GET",
+            "url": "https://api.socialmedia.com/posts",
+            "params": {"limit": 100}
+        }
+    },
+    {
+        "id": "2",
+        "type": "data_processing",
+        "name": "Analyze Engagement",
+        "config": {
+            "algorithm": "engagement_score",
+            "threshold": 0.8
+        }
+    },
+    {
+        "id": "3",
+        "type": "content_generation",
+        "name": "Generate Targeted Content",
+        "config": {
+            "model": "text_generation",
+            "prompt": "Create engaging content about {topic}"
+        }
+    },
+    {
+        "id": "4",
+        "type": "api_call",
+        "name": "Post to Platforms",
+        "config": {
+            "method": "POST",
+            "url": "https://api.socialmedia.com/posts",
+            "data_source": "generated_content"
+        }
+    }
+]
+
+AUTOMATION_WORKFLOW_STEPS = [
+    {
+        "id": "1",
+        "type": "data_fetch",
+        "name": "Fetch Data",
+        "config": {
+            "source": "database",
+            "query": "SELECT * FROM users WHERE active = true"
+        }
+    },
+    {
+        "id": "2",
+        "type": "data_processing",
+        "name": "Process Data",
+        "config": {
+            "operation": "filter",
+            "criteria": "age > 18"
+        }
+    },
+    {
+        "id": "3",
+        "type": "notification",
+        "name": "Send Notifications",
+        "config": {
+            "method": "email",
+            "template": "user_notification"
+        }
+    }
+]
+
+GENERIC_WORKFLOW_STEPS = [
+    {
+        "id": "1",
+        "type": "input",
+        "name": "Get Input",
+        "config": {
+            "type": "form",
+            "fields": ["name", "email"]
+        }
+    },
+    {
+        "id": "2",
+        "type": "process",
+        "name": "Process Data",
+        "config": {
+            "operation": "validate"
+        }
+    },
+    {
+        "id": "3",
+        "type": "output",
+        "name": "Generate Output",
+        "config": {
+            "format": "json"
+        }
+    }
+]
+
+def workflow_structure(steps):
+    """Wrap template steps in a workflow structure"""
+    return {
+        "steps": steps,
+        "triggers": ["manual", "scheduled"],
+        "conditions": []
+    }
+
+SOCIAL_MEDIA_WORKFLOW_STRUCTURE = workflow_structure(SOCIAL_MEDIA_WORKFLOW_STEPS)
+AUTOMATION_WORKFLOW_STRUCTURE = workflow_structure(AUTOMATION_WORKFLOW_STEPS)
+GENERIC_WORKFLOW_STRUCTURE = workflow_structure(GENERIC_WORKFLOW_STEPS)
+
 def generate_app_structure(description):
     """Generate app structure based on natural language description"""
-    structure = {
-        "pages": [],
-        "components": [],
-        "data_sources": [],
-        "events": []
-    }
-    
     # Simple keyword-based parsing for demo
-    description_lower = description.lower()
-    
-    if "social media" in description_lower:
-        structure["pages"] = [
-            {"id": "dashboard", "name": "Dashboard", "type": "dashboard"},
-            {"id": "posts", "name": "Posts", "type": "list"},
-            {"id": "analytics", "name": "Analytics", "type": "chart"}
-        ]
-        structure["components"] = [
-            {"type": "button", "text": "Create Post"},
-            {"type": "input", "placeholder": "Search posts"},
-            {"type": "chart", "type": "bar"}
-        ]
-    
-    elif "e-commerce" in description_lower:
-        structure["pages"] = [
-            {"id": "home", "name": "Home", "type": "landing"},
-            {"id": "products", "name": "Products", "type": "grid"},
-            {"id": "cart", "name": "Cart", "type": "form"}
-        ]
-        structure["components"] = [
-            {"type": "button", "text": "Add to Cart"},
-            {"type": "input", "placeholder": "Search products"},
-            {"type": "image-gallery"}
-        ]
+    keywords = match_keywords(description)
     
+    if "social media" in keywords:
+        return SOCIAL_MEDIA_APP_STRUCTURE
+    elif "e-commerce" in keywords:
+        return ECOMMERCE_APP_STRUCTURE
     else:
         # Generic app structure
-        structure["pages"] = [
-            {"id": "main", "name": "Main", "type": "form"},
-            {"id": "list", "name": "List", "type": "list"}
-        ]
-        structure["components"] = [
-            {"type": "button", "text": "Submit"},
-            {"type": "input", "placeholder": "Enter text"},
-            {"type": "text-display"}
-        ]
-    
-    # Add data sources
-    structure["data_sources"] = [
-        {"id": "local_storage", "type": "local", "name": "Local Storage"},
-        {"id": "api", "type": "rest", "url": "https://api.example.com/data"}
-    ]
-    
-    return structure
+        return GENERIC_APP_STRUCTURE
 
 def generate_workflow_structure(description):
     """Generate workflow structure based on description"""
-    steps = []
-    
-    description_lower = description.lower()
-    
-    if "social media" in description_lower and "influence" in description_lower:
-        steps = [
-            {
-                "id": "1",
-                "type": "api_call",
-                "name": "Fetch Social Media Data",
-                "config": {
-                    "method": "GET",
-                    "url": "https://api.socialmedia.com/posts",
-                    "params": {"limit": 100}
-                }
-            },
-            {
-                "id": "2",
-                "type": "data_processing",
-                "name": "Analyze Engagement",
-                "config": {
-                    "algorithm": "engagement_score",
-                    "threshold": 0.8
-                }
-            },
-            {
-                "id": "3",
-                "type": "content_generation",
-                "name": "Generate Targeted Content",
-                "config": {
-                    "model": "text_generation",
-                    "prompt": "Create engaging content about {topic}"
-                }
-            },
-            {
-                "id": "4",
-                "type": "api_call",
-                "name": "Post to Platforms",
-                "config": {
-                    "method": "POST",
-                    "url": "https://api.socialmedia.com/posts",
-                    "data_source": "generated_content"
-                }
-            }
-        ]
-    
-    elif "automation" in description_lower:
-        steps = [
-            {
-                "id": "1",
-                "type": "data_fetch",
-                "name": "Fetch Data",
-                "config": {
-                    "source": "database",
-                    "query": "SELECT * FROM users WHERE active = true"
-                }
-            },
-            {
-                "id": "2",
-                "type": "data_processing",
-                "name": "Process Data",
-                "config": {
-                    "operation": "filter",
-                    "criteria": "age > 18"
-                }
-            },
-            {
-                "id": "3",
-                "type": "notification",
-                "name": "Send Notifications",
-                "config": {
-                    "method": "email",
-                    "template": "user_notification"
-                }
-            }
-        ]
+    keywords = match_keywords(description)
     
+    if "social media" in keywords and "influence" in keywords:
+        return SOCIAL_MEDIA_WORKFLOW_STRUCTURE
+    elif "automation" in keywords:
+        return AUTOMATION_WORKFLOW_STRUCTURE
     else:
         # Generic workflow
-        steps = [
-            {
-                "id": "1",
-                "type": "input",
-                "name": "Get Input",
-                "config": {
-                    "type": "form",
-                    "fields": ["name", "email"]
-                }
-            },
-            {
-                "id": "2",
-                "type": "process",
-                "name": "Process Data",
-                "config": {
-                    "operation": "validate"
-                }
-            },
-            {
-                "id": "3",
-                "type": "output",
-                "name": "Generate Output",
-                "config": {
-                    "format": "json"
-                }
-            }
-        ]
-    
-    return {
-        "steps": steps,
-        "triggers": ["manual", "scheduled"],
-        "conditions": []
-    }
+        return GENERIC_WORKFLOW_STRUCTURE
 
 def execute_workflow_steps(structure, input_data):
     """Execute workflow steps with provided input data"""
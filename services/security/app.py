@@ -1,15 +1,47 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, session, abort
+from flask.json.provider import JSONProvider
+import orjson
 from cryptography.fernet import Fernet
 import jwt
-import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 import secrets
 import time
 import json
-from functools import wraps
+import hmac
+import hashlib
+import base64
+from functools import wraps, lru_cache
+from collections import deque, defaultdict
 from datetime import datetime, timedelta
 import logging
+import threading
+from cachetools import LRUCache
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Request bodies larger than this are rejected with 413 before being read
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+@app.before_request
+def limit_request_size():
+    if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+        abort(413)
+
+def read_json():
+    """Parse the JSON request body with orjson, without caching the raw bytes"""
+    return orjson.loads(request.get_data(cache=False))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,14 +50,33 @@ logger = logging.getLogger(__name__)
 # Security configuration
 SECRET_KEY = secrets.token_hex(32)
 JWT_SECRET = secrets.token_hex(32)
+JWT_SECRET_BYTES = JWT_SECRET.encode('utf-8')
+JWT_CACHE_SIZE = 4096
 ENCRYPTION_KEY = Fernet.generate_key()
 fernet = Fernet(ENCRYPTION_KEY)
+ENCRYPTION_KEY_TEXT = ENCRYPTION_KEY.decode('ascii')
+
+# argon2id password hashing, a fraction of bcrypt's per-login CPU time
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
 
 # In-memory storage for demo purposes
 users_db = {}
 sessions_db = {}
-security_logs = []
 custom_protocols = {}
+# user_id -> {protocol_id: protocol}, for listing a user's protocols without a scan
+user_protocols_index = defaultdict(dict)
+
+# Bounded audit log, plus the most recent events per user for O(k) lookups.
+# Index entries carry the event's sequence number, so events already evicted
+# from the audit log are skipped; the index itself keeps the most recently
+# active users only.
+SECURITY_LOG_CAPACITY = 100_000
+USER_SECURITY_LOG_CAPACITY = 1000
+USER_LOG_INDEX_USERS = 10_000
+security_logs = deque(maxlen=SECURITY_LOG_CAPACITY)
+security_log_total = 0
+user_log_index = LRUCache(maxsize=USER_LOG_INDEX_USERS)
+security_log_lock = threading.Lock()
 
 # Security event types
 SECURITY_EVENTS = {
@@ -37,24 +88,45 @@ SECURITY_EVENTS = {
     'CUSTOM_PROTOCOL_USAGE': 'custom_protocol_usage'
 }
 
-def log_security_event(event_type, user_id=None, details=None):
-    """Log security events for auditing"""
+EPOCH = datetime(1970, 1, 1)
+
+def format_timestamp(timestamp_us):
+    """Format a microsecond Unix timestamp as a UTC ISO 8601 string"""
+    return (EPOCH + timedelta(microseconds=timestamp_us)).isoformat()
+
+def log_security_event(event_type, user_id=None, details=None, indexed=True):
+    """Log security events for auditing (per-user index only for registered user ids)"""
+    global security_log_total
+    # Stored as integer microseconds; formatted only when logs are read
     event = {
-        'timestamp': datetime.utcnow().isoformat(),
+        'timestamp': time.time_ns() // 1000,
         'event_type': event_type,
         'user_id': user_id,
         'details': details or {},
         'source_ip': request.remote_addr if request else None
     }
-    security_logs.append(event)
-    logger.info(f"Security Event: {event}")
+    with security_log_lock:
+        sequence = security_log_total
+        security_log_total += 1
+        security_logs.append(event)
+        if user_id is not None and indexed:
+            user_logs = user_log_index.get(user_id)
+            if user_logs is None:
+                user_logs = deque(maxlen=USER_SECURITY_LOG_CAPACITY)
+                user_log_index[user_id] = user_logs
+            user_logs.append((sequence, event))
+    logger.info("Security Event: %s", event)
 
 def authenticate_user(username, password):
-    """Authenticate user with bcrypt"""
+    """Authenticate user with argon2id"""
     user = users_db.get(username)
-    if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
-        return user
-    return None
+    if not user:
+        return None
+    try:
+        password_hasher.verify(user['password_hash'], password)
+    except (VerificationError, InvalidHashError):
+        return None
+    return user
 
 def generate_jwt_token(user_id):
     """Generate JWT token for authenticated user"""
@@ -65,15 +137,40 @@ def generate_jwt_token(user_id):
     }
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
+def base64url_decode(segment):
+    """Decode an unpadded base64url JWT segment"""
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+@lru_cache(maxsize=JWT_CACHE_SIZE)
+def decode_jwt_token(token):
+    """Check an HS256 token's signature and return (user_id, exp), or None"""
+    try:
+        header_segment, payload_segment, signature_segment = token.split('.')
+        signing_input = f"{header_segment}.{payload_segment}".encode('ascii')
+        signature = hmac.new(JWT_SECRET_BYTES, signing_input, hashlib.sha256).digest()
+        if not hmac.compare_digest(signature, base64url_decode(signature_segment)):
+            return None
+        
+        header = json.loads(base64url_decode(header_segment))
+        if header.get('alg') != 'HS256':
+            return None
+        
+        payload = json.loads(base64url_decode(payload_segment))
+        return payload['user_id'], payload['exp']
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
 def verify_jwt_token(token):
     """Verify JWT token"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload['user_id']
-    except jwt.ExpiredSignatureError:
+    # Signature checks are cached per token; expiry is checked on every call
+    decoded = decode_jwt_token(token)
+    if decoded is None:
         return None
-    except jwt.InvalidTokenError:
+    
+    user_id, exp = decoded
+    if exp <= time.time():
         return None
+    return user_id
 
 def require_auth(f):
     """Decorator to require authentication"""
@@ -103,7 +200,7 @@ def health():
 def register():
     """Register a new user"""
     try:
-        data = request.json
+        data = read_json()
         username = data.get('username', '')
         password = data.get('password', '')
         email = data.get('email', '')
@@ -115,7 +212,7 @@ def register():
             return jsonify({"error": "Username already exists"}), 409
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        password_hash = password_hasher.hash(password)
         
         user = {
             'username': username,
@@ -142,22 +239,26 @@ def register():
 def login():
     """Authenticate user and return JWT token"""
     try:
-        data = request.json
+        data = read_json()
         username = data.get('username', '')
         password = data.get('password', '')
         
         if not username or not password:
             return jsonify({"error": "Username and password are required"}), 400
         
-        log_security_event(SECURITY_EVENTS['LOGIN_ATTEMPT'], username)
+        # Unknown usernames stay out of the per-user index so they cannot evict real users
+        known_user = username in users_db
+        log_security_event(SECURITY_EVENTS['LOGIN_ATTEMPT'], username, indexed=known_user)
         
         user = authenticate_user(username, password)
         if not user:
-            log_security_event(SECURITY_EVENTS['LOGIN_FAILURE'], username, {'reason': 'invalid_credentials'})
+            log_security_event(
+                SECURITY_EVENTS['LOGIN_FAILURE'], username, {'reason': 'invalid_credentials'}, indexed=known_user
+            )
             return jsonify({"error": "Invalid credentials"}), 401
         
         if not user['is_active']:
-            log_security_event(SECURITY_EVENTS['LOGIN_FAILURE'], username, {'reason': 'account_disabled'})
+            log_security_event(SECURITY_EVENTS['LOGIN_FAILURE'], username, {'reason': 'account_disabled'}, indexed=known_user)
             return jsonify({"error": "Account disabled"}), 403
         
         token = generate_jwt_token(username)
@@ -182,7 +283,7 @@ def login():
 def encrypt_data(user_id):
     """Encrypt data using zero-knowledge architecture"""
     try:
-        data = request.json
+        data = read_json()
         plaintext = data.get('data', '')
         
         if not plaintext:
@@ -196,9 +297,18 @@ def encrypt_data(user_id):
             'data_length': len(plaintext)
         })
         
+        # Fernet tokens are already base64url, so ?raw=1 sends the token bytes
+        # as-is instead of wrapping them in JSON
+        if request.args.get('raw') == '1':
+            return Response(
+                encrypted_data,
+                mimetype='application/octet-stream',
+                headers={'X-Encryption-Key': ENCRYPTION_KEY_TEXT}
+            )
+        
         return jsonify({
-            "encrypted_data": encrypted_data.decode('utf-8'),
-            "encryption_key": ENCRYPTION_KEY.decode('utf-8'),
+            "encrypted_data": encrypted_data.decode('ascii'),
+            "encryption_key": ENCRYPTION_KEY_TEXT,
             "status": "success"
         })
         
@@ -210,14 +320,14 @@ def encrypt_data(user_id):
 def decrypt_data(user_id):
     """Decrypt data using zero-knowledge architecture"""
     try:
-        data = request.json
+        data = read_json()
         encrypted_data = data.get('data', '')
         
         if not encrypted_data:
             return jsonify({"error": "Encrypted data is required"}), 400
         
         # Decrypt data
-        decrypted_data = fernet.decrypt(encrypted_data.encode('utf-8'))
+        decrypted_data = fernet.decrypt(encrypted_data.encode('ascii'))
         
         log_security_event(SECURITY_EVENTS['ENCRYPTION_OPERATION'], user_id, {
             'operation': 'decrypt',
@@ -237,7 +347,7 @@ def decrypt_data(user_id):
 def create_custom_protocol(user_id):
     """Create a custom security protocol"""
     try:
-        data = request.json
+        data = read_json()
         protocol_name = data.get('name', '')
         encryption_algorithm = data.get('encryption_algorithm', 'AES')
         key_length = data.get('key_length', 256)
@@ -261,6 +371,7 @@ def create_custom_protocol(user_id):
         }
         
         custom_protocols[protocol_id] = protocol
+        user_protocols_index[user_id][protocol_id] = protocol
         
         log_security_event(SECURITY_EVENTS['CUSTOM_PROTOCOL_USAGE'], user_id, {
             'protocol_id': protocol_id,
@@ -289,7 +400,7 @@ def apply_custom_protocol(user_id, protocol_id):
         if protocol['user_id'] != user_id:
             return jsonify({"error": "Access denied"}), 403
         
-        data = request.json
+        data = read_json()
         target_data = data.get('data', '')
         
         if not target_data:
@@ -319,8 +430,15 @@ def apply_custom_protocol(user_id, protocol_id):
 def get_security_logs(user_id):
     """Get security logs for the user"""
     try:
-        # Filter logs for this user
-        user_logs = [log for log in security_logs if log.get('user_id') == user_id]
+        with security_log_lock:
+            oldest_sequence = security_log_total - len(security_logs)
+            entries = list(user_log_index.get(user_id, ()))
+        
+        user_logs = [
+            {**log, 'timestamp': format_timestamp(log['timestamp'])}
+            for sequence, log in entries
+            if sequence >= oldest_sequence
+        ]
         
         return jsonify({
             "user_id": user_id,
@@ -337,7 +455,7 @@ def get_security_logs(user_id):
 def list_protocols(user_id):
     """List custom protocols for the user"""
     try:
-        user_protocols = [p for p in custom_protocols.values() if p['user_id'] == user_id]
+        user_protocols = list(user_protocols_index.get(user_id, {}).values())
         
         return jsonify({
             "user_id": user_id,
@@ -349,9 +467,9 @@ def list_protocols(user_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
-    # Create default admin user for testing
-    admin_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+def create_default_admin():
+    """Create default admin user for testing"""
+    admin_password = password_hasher.hash('admin123')
     users_db['admin'] = {
         'username': 'admin',
         'password_hash': admin_password,
@@ -359,5 +477,9 @@ if __name__ == '__main__':
         'created_at': datetime.utcnow().isoformat(),
         'is_active': True
     }
-    
+
+# Runs at import so the admin user also exists under gunicorn
+create_default_admin()
+
+if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8005, debug=False)
\ No newline at end of file
@@ -1,40 +1,385 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, abort
 from gtts import gTTS
-from moviepy.editor import *
+import numpy as np
+from numba import njit, prange
 import tempfile
+import subprocess
+import shutil
 import os
 import base64
 import io
+import mmap
+import hashlib
+import json
+import re
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import redis
+from rq import Queue
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
 
 app = Flask(__name__)
 
+# Input limits, checked before any work is queued: larger bodies are rejected
+# with 413 before being read, and so are oversized texts and prompt lists
+MAX_REQUEST_BYTES = 1024 * 1024
+MAX_TEXT_LENGTH = 4096
+MAX_PROMPTS = 32
+MAX_PROMPT_LENGTH = 256
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+@app.before_request
+def limit_request_size():
+    if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+        abort(413)
+
+# Encoder settings for the slideshow: every frame is a still image, so
+# stillimage tuning with the veryfast preset costs little quality. faststart
+# puts the index first so playback can begin before the download finishes.
+# Threads are left to x264's default (1.5x cores).
+VIDEO_FPS = 24
+X264_ARGS = ['-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'stillimage', '-pix_fmt', 'yuv420p']
+MP4_ARGS = ['-movflags', '+faststart']
+
+# Hardware H.264 encoders tried before libx264 when VIDEO_HW_ENCODER is
+# 'auto' (the default); set it to 'nvenc' or 'vaapi' to allow only that one,
+# or 'none' to always encode on the CPU
+VIDEO_HW_ENCODER = os.environ.get('VIDEO_HW_ENCODER', 'auto')
+VAAPI_DEVICE = os.environ.get('VAAPI_DEVICE', '/dev/dri/renderD128')
+HW_ENCODER_ARGS = {
+    'nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll', '-rc', 'constqp', '-qp', '23', '-pix_fmt', 'yuv420p'],
+    'vaapi': ['-vaapi_device', VAAPI_DEVICE, '-vf', 'format=nv12,hwupload', '-c:v', 'h264_vaapi', '-qp', '26'],
+}
+
+# Placeholder frames are written as binary PPM: a fixed header plus the raw
+# RGB bytes, with no compression to encode here or decode in ffmpeg
+PLACEHOLDER_WIDTH = 640
+PLACEHOLDER_HEIGHT = 480
+PPM_HEADER = f"P6\n{PLACEHOLDER_WIDTH} {PLACEHOLDER_HEIGHT}\n255\n".encode('ascii')
+
+# Each still is encoded once into an H.264 segment, cached by SHA-256 of the
+# frame, duration and encoder settings, and the final video stream-copies the
+# segments. Every segment uses the same settings, which keeps the copy valid.
+SEGMENT_CACHE_DIR = os.environ.get('VIDEO_SEGMENT_CACHE_DIR', '/app/cache/segments')
+os.makedirs(SEGMENT_CACHE_DIR, exist_ok=True)
+
+# Shared by the per-job work that can overlap: the TTS call, placeholder
+# frames and segment encodes
+render_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
+# Videos are rendered by RQ workers (`rq worker video`) and written to a
+# directory shared with the web process, which serves them by job id
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+VIDEO_QUEUE = 'video'
+VIDEO_RESULTS_DIR = os.environ.get('VIDEO_RESULTS_DIR', '/app/results')
+VIDEO_JOB_TIMEOUT = 600
+VIDEO_JOB_TTL = 24 * 60 * 60
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+# Job ids are SHA-256 of the request, so a finished result never changes:
+# clients and proxies may cache it, revalidating by the job id as ETag
+RESULT_MAX_AGE = 24 * 60 * 60
+# Clients reach results through the API gateway, not this service's /result route
+RESULT_URL_TEMPLATE = '/api/v1/video/result/{job_id}'
+os.makedirs(VIDEO_RESULTS_DIR, exist_ok=True)
+
+redis_conn = redis.Redis.from_url(REDIS_URL)
+video_queue = Queue(VIDEO_QUEUE, connection=redis_conn)
+
+# Per-job intermediates (voiceover, frames, output) are small and short-lived,
+# so they are written to tmpfs when it has room instead of the disk-backed
+# temp dir
+SCRATCH_DIR = os.environ.get('VIDEO_SCRATCH_DIR', '/dev/shm')
+SCRATCH_MIN_FREE_BYTES = 64 * 1024 * 1024
+
+# ?format=json responses are streamed, base64-encoding this much input per
+# chunk; a multiple of 3 bytes, so no chunk but the last gets '=' padding
+BASE64_CHUNK_BYTES = 57 * 4096
+
+# Synthesized speech is cached on disk by SHA-256 of (lang, text), so repeated
+# inputs skip the gTTS round trip
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', '/app/cache/tts')
+
+# Speech engine: 'gtts' calls Google's service; 'piper' runs a local voice
+# model (PIPER_MODEL) on the CPU, with no network dependency
+TTS_ENGINE = os.environ.get('TTS_ENGINE', 'gtts')
+PIPER_MODEL = os.environ.get('PIPER_MODEL', '/app/models/en_US-lessac-medium.onnx')
+os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+
+# Rendered videos are kept as long as clients may cache them; cached segments
+# and speech are kept while they are reused (hits refresh their mtime). The
+# RQ worker prunes all three by mtime, at most once per interval.
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+CACHE_PRUNE_INTERVAL = 60 * 60
+last_cache_prune = 0.0
+
+def tts_cache_path(text, lang):
+    """Path of the cached MP3 for the text and language"""
+    key_text = f"{lang}|{text}"
+    if TTS_ENGINE == 'piper':
+        # A piper voice speaks a single language, so the model decides the audio
+        key_text = f"piper|{os.path.basename(PIPER_MODEL)}|{key_text}"
+    key = hashlib.sha256(key_text.encode('utf-8')).hexdigest()
+    return os.path.join(TTS_CACHE_DIR, f"{key}.mp3")
+
+def piper_to_speech(text):
+    """Synthesize text with the local piper voice, returning MP3 bytes"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wav_path = os.path.join(temp_dir, "speech.wav")
+        result = subprocess.run(
+            ['piper', '--model', PIPER_MODEL, '--output_file', wav_path],
+            input=text.encode('utf-8'),
+            capture_output=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"piper failed: {result.stderr.decode(errors='replace').strip()}")
+        return run_ffmpeg(['-i', wav_path, '-c:a', 'libmp3lame', '-q:a', '4', '-f', 'mp3', 'pipe:1'])
+
 def text_to_speech(text, lang='en'):
-    """Convert text to speech using gTTS"""
-    tts = gTTS(text=text, lang=lang, slow=False)
-    return tts
-
-def create_video_from_images_and_audio(image_paths, audio_path, duration=5):
-    """Create a video from images and audio"""
-    # Create a list of ImageClips
-    clips = []
-    for image_path in image_paths:
-        clip = ImageClip(image_path).set_duration(duration / len(image_paths))
-        clips.append(clip)
+    """Convert text to speech with the configured engine, returning MP3 bytes"""
+    cache_path = tts_cache_path(text, lang)
+    try:
+        with open(cache_path, 'rb') as f:
+            audio_bytes = f.read()
+        os.utime(cache_path)
+        return audio_bytes
+    except FileNotFoundError:
+        pass
+    
+    if TTS_ENGINE == 'piper':
+        audio_bytes = piper_to_speech(text)
+    else:
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=False).write_to_fp(buffer)
+        audio_bytes = buffer.getvalue()
+    
+    # Write to a temporary file and rename so readers never see partial MP3s
+    fd, tmp_path = tempfile.mkstemp(dir=TTS_CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(audio_bytes)
+    os.replace(tmp_path, cache_path)
+    
+    return audio_bytes
+
+def speech_file(text, lang='en'):
+    """Path of the cached MP3 for the text, synthesizing it first if needed"""
+    cache_path = tts_cache_path(text, lang)
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+    else:
+        text_to_speech(text, lang)
+    return cache_path
+
+def run_ffmpeg(args):
+    """Run ffmpeg with the given arguments, returning its output or raising its errors"""
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', *args],
+        stdin=subprocess.DEVNULL,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+@lru_cache(maxsize=None)
+def video_encoder_args():
+    """Encoder arguments for segments: the first hardware encoder that works, else libx264"""
+    for name, encoder_args in HW_ENCODER_ARGS.items():
+        if VIDEO_HW_ENCODER not in ('auto', name):
+            continue
+        # ffmpeg builds list encoders whose hardware is missing, so try a frame
+        try:
+            run_ffmpeg([
+                '-f', 'lavfi', '-i', 'color=s=256x256:d=0.1', '-frames:v', '1',
+                *encoder_args,
+                '-f', 'null', '-'
+            ])
+        except (OSError, RuntimeError):
+            continue
+        return encoder_args
+    return X264_ARGS
+
+def encode_segment(image_path, frame_count):
+    """Encode a still image shown for frame_count frames, returning the cached segment path"""
+    encoder_args = video_encoder_args()
+    digest = hashlib.sha256(f"{frame_count}|{VIDEO_FPS}|{' '.join(encoder_args)}|".encode('ascii'))
+    with open(image_path, 'rb') as f:
+        digest.update(f.read())
+    segment_path = os.path.join(SEGMENT_CACHE_DIR, f"{digest.hexdigest()}.mp4")
+    if os.path.exists(segment_path):
+        os.utime(segment_path)
+        return segment_path
     
-    # Concatenate clips
-    video = concatenate_videoclips(clips, method="compose")
+    fd, tmp_path = tempfile.mkstemp(dir=SEGMENT_CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        run_ffmpeg([
+            '-loop', '1', '-framerate', str(VIDEO_FPS), '-i', image_path,
+            '-frames:v', str(frame_count),
+            *encoder_args,
+            '-f', 'mp4',
+            tmp_path
+        ])
+        os.replace(tmp_path, segment_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return segment_path
+
+def create_video_from_images_and_audio(image_paths, audio_path, video_path, duration=5):
+    """Render the images as a slideshow over the looped audio"""
+    # Segments hold whole frames, so split the video's frames between the
+    # images such that the counts add up to exactly its length
+    total_frames = round(duration * VIDEO_FPS)
+    frame_counts = [
+        (i + 1) * total_frames // len(image_paths) - i * total_frames // len(image_paths)
+        for i in range(len(image_paths))
+    ]
+    shots = [(image_path, frames) for image_path, frames in zip(image_paths, frame_counts) if frames]
+    
+    # Encode each distinct shot once, even if it is shown several times
+    unique_shots = list(dict.fromkeys(shots))
+    segments = dict(zip(unique_shots, render_executor.map(
+        encode_segment, [image_path for image_path, _ in unique_shots], [frames for _, frames in unique_shots]
+    )))
+    segment_paths = [segments[shot] for shot in shots]
     
-    # Add audio
-    audio = AudioFileClip(audio_path)
-    final_audio = afx.audio_loop(audio, duration=video.duration)
-    video = video.set_audio(final_audio)
+    # The concat list goes next to the frames; video_path may be elsewhere
+    list_path = os.path.join(os.path.dirname(image_paths[0]), "segments.txt")
+    with open(list_path, 'w') as f:
+        for segment_path in segment_paths:
+            f.write(f"file '{segment_path}'\n")
     
-    return video
+    # Only the audio is encoded here; the video segments are copied as-is
+    run_ffmpeg([
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        # Loop the voiceover and cut the output at the video's length; an
+        # explicit -t stops reading the endless audio input at a fixed point,
+        # where -shortest can overshoot by a few buffered audio frames
+        '-stream_loop', '-1', '-i', audio_path,
+        '-t', str(duration),
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        *MP4_ARGS,
+        '-f', 'mp4',
+        video_path
+    ])
+
+def base64_json_stream(fields, key, data):
+    """Yield a JSON object of fields with data base64-encoded under key, in chunks"""
+    yield json.dumps(fields, separators=(',', ':'))[:-1].encode() + f',"{key}":"'.encode()
+    with memoryview(data) as view:
+        for offset in range(0, len(view), BASE64_CHUNK_BYTES):
+            yield base64.b64encode(view[offset:offset + BASE64_CHUNK_BYTES])
+    yield b'"}'
+
+def file_base64_json_stream(fields, key, path):
+    """Like base64_json_stream, reading the file through mmap instead of into memory"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from base64_json_stream(fields, key, mm)
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "healthy", "service": "video-generation"})
 
+def placeholder_color(index):
+    return (index * 50 % 255, (index * 100) % 255, (index * 150) % 255)
+
+@njit(parallel=True, cache=True)
+def fill_placeholders(frames, colors):
+    """Fill frames[k] with colors[k], splitting the rows of all frames across threads"""
+    height = frames.shape[1]
+    for row in prange(frames.shape[0] * height):
+        k = row // height
+        y = row % height
+        for x in range(frames.shape[2]):
+            frames[k, y, x, 0] = colors[k, 0]
+            frames[k, y, x, 1] = colors[k, 1]
+            frames[k, y, x, 2] = colors[k, 2]
+
+def write_frame(frame, image_path):
+    """Write an RGB frame as binary PPM"""
+    with open(image_path, 'wb') as f:
+        f.write(PPM_HEADER)
+        f.write(frame.data)
+
+def render_placeholders(indices, image_paths):
+    """Write a solid-color placeholder frame for the prompt at each index"""
+    colors = np.array([placeholder_color(i) for i in indices], dtype=np.uint8)
+    frames = np.empty((len(indices), PLACEHOLDER_HEIGHT, PLACEHOLDER_WIDTH, 3), dtype=np.uint8)
+    fill_placeholders(frames, colors)
+    list(render_executor.map(write_frame, frames, image_paths))
+
+def video_job_id(text, image_prompts):
+    """Deterministic job id, so identical requests share one render"""
+    canonical = json.dumps([text, image_prompts], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def video_result_path(job_id):
+    return os.path.join(VIDEO_RESULTS_DIR, f"{job_id}.mp4")
+
+def prune_directory(directory, max_age):
+    """Delete the files in directory last modified more than max_age seconds ago"""
+    cutoff = time.time() - max_age
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+def prune_caches():
+    """Evict expired results, segments and speech, unless done within the interval"""
+    global last_cache_prune
+    now = time.time()
+    if now - last_cache_prune < CACHE_PRUNE_INTERVAL:
+        return
+    last_cache_prune = now
+    
+    prune_directory(VIDEO_RESULTS_DIR, RESULT_MAX_AGE)
+    prune_directory(SEGMENT_CACHE_DIR, CACHE_MAX_AGE)
+    prune_directory(TTS_CACHE_DIR, CACHE_MAX_AGE)
+
+def make_job_dir():
+    """Create a temporary directory for a render, on tmpfs when it has room"""
+    if os.path.isdir(SCRATCH_DIR) and shutil.disk_usage(SCRATCH_DIR).free >= SCRATCH_MIN_FREE_BYTES:
+        return tempfile.mkdtemp(dir=SCRATCH_DIR)
+    return tempfile.mkdtemp()
+
+def render_video(job_id, text, image_prompts):
+    """Render the video for a job into the results directory (runs on an RQ worker)"""
+    temp_dir = make_job_dir()
+    
+    try:
+        # Synthesize the voiceover while the placeholder frames are written;
+        # ffmpeg reads it straight from the speech cache
+        voiceover = render_executor.submit(speech_file, text)
+        
+        # Generate images (for demo, create placeholder images)
+        # In a real implementation, you would call the image generation service
+        # Repeated prompts reuse the frame of their first occurrence
+        first_indices = {}
+        for i, prompt in enumerate(image_prompts):
+            first_indices.setdefault(prompt, i)
+        frame_paths = {i: os.path.join(temp_dir, f"image_{i}.ppm") for i in first_indices.values()}
+        render_placeholders(list(frame_paths.keys()), list(frame_paths.values()))
+        image_paths = [frame_paths[first_indices[prompt]] for prompt in image_prompts]
+        voiceover_path = voiceover.result()
+        
+        # Mux into the results directory, then publish under the job id in one rename
+        result_path = video_result_path(job_id)
+        create_video_from_images_and_audio(image_paths, voiceover_path, result_path + '.tmp')
+        os.replace(result_path + '.tmp', result_path)
+        
+    finally:
+        # Clean up temporary files
+        shutil.rmtree(temp_dir)
+    
+    prune_caches()
+    return result_path
+
 @app.route('/generate', methods=['POST'])
 def generate_video():
     try:
@@ -48,48 +393,90 @@ def generate_video():
         if not image_prompts:
             return jsonify({"error": "Image prompts are required"}), 400
         
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
+        if not isinstance(text, str) or not isinstance(image_prompts, list):
+            return jsonify({"error": "Text must be a string and image prompts a list"}), 400
+        
+        if not all(isinstance(prompt, str) for prompt in image_prompts):
+            return jsonify({"error": "Image prompts must be strings"}), 400
+        
+        if len(text) > MAX_TEXT_LENGTH:
+            return jsonify({"error": f"Text is limited to {MAX_TEXT_LENGTH} characters"}), 413
+        
+        if len(image_prompts) > MAX_PROMPTS:
+            return jsonify({"error": f"At most {MAX_PROMPTS} image prompts are allowed"}), 413
         
+        if any(len(prompt) > MAX_PROMPT_LENGTH for prompt in image_prompts):
+            return jsonify({"error": f"Image prompts are limited to {MAX_PROMPT_LENGTH} characters"}), 413
+        
+        job_id = video_job_id(text, image_prompts)
+        result_url = RESULT_URL_TEMPLATE.format(job_id=job_id)
+        
+        if os.path.exists(video_result_path(job_id)):
+            return jsonify({"job_id": job_id, "status": "finished", "result_url": result_url})
+        
+        # Reuse a queued or running render of the same request; a finished job
+        # whose file has since been pruned is rendered again
         try:
-            # Generate voiceover
-            tts = text_to_speech(text)
-            voiceover_path = os.path.join(temp_dir, "voiceover.mp3")
-            tts.save(voiceover_path)
-            
-            # Generate images (for demo, create placeholder images)
-            image_paths = []
-            for i, prompt in enumerate(image_prompts):
-                # In a real implementation, you would call the image generation service
-                # For now, create a simple colored image
-                img = Image.new('RGB', (640, 480), color=(i*50 % 255, (i*100) % 255, (i*150) % 255))
-                img_path = os.path.join(temp_dir, f"image_{i}.png")
-                img.save(img_path)
-                image_paths.append(img_path)
-            
-            # Create video
-            video = create_video_from_images_and_audio(image_paths, voiceover_path)
-            
-            # Save video to temporary file
-            video_path = os.path.join(temp_dir, "output.mp4")
-            video.write_videofile(video_path, codec='libx264', audio_codec='aac')
-            
-            # Read video file and convert to base64
-            with open(video_path, 'rb') as f:
-                video_bytes = f.read()
-                video_base64 = base64.b64encode(video_bytes).decode()
-            
-            return jsonify({
-                "text": text,
-                "image_prompts": image_prompts,
-                "video_base64": video_base64,
-                "status": "success"
-            })
+            job = Job.fetch(job_id, connection=redis_conn)
+            status = job.get_status()
+        except NoSuchJobError:
+            status = None
+        
+        if status in (None, 'finished', 'failed', 'stopped', 'canceled'):
+            job = video_queue.enqueue(
+                render_video, job_id, text, image_prompts,
+                job_id=job_id,
+                job_timeout=VIDEO_JOB_TIMEOUT,
+                result_ttl=VIDEO_JOB_TTL,
+                failure_ttl=VIDEO_JOB_TTL
+            )
+            status = job.get_status()
+        
+        return jsonify({"job_id": job_id, "status": status, "result_url": result_url}), 202
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/result/<job_id>', methods=['GET'])
+def get_video_result(job_id):
+    try:
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return jsonify({"error": "Job not found"}), 404
+        
+        # MP4 is streamed as-is by default; ?format=json keeps the base64 envelope
+        response_format = request.args.get('format', 'mp4')
+        if response_format not in ('mp4', 'json'):
+            return jsonify({"error": f"Unsupported format: {response_format}"}), 400
+        
+        result_path = video_result_path(job_id)
+        if os.path.exists(result_path):
+            if response_format == 'json':
+                response = Response(
+                    file_base64_json_stream({"job_id": job_id, "status": "success"}, "video_base64", result_path),
+                    mimetype='application/json'
+                )
+                response.set_etag(f"{job_id}-json")
+                response.cache_control.public = True
+                response.cache_control.max_age = RESULT_MAX_AGE
+                return response.make_conditional(request)
             
-        finally:
-            # Clean up temporary files
-            import shutil
-            shutil.rmtree(temp_dir)
+            return send_file(
+                result_path, mimetype='video/mp4', download_name='output.mp4', etag=job_id, max_age=RESULT_MAX_AGE
+            )
+        
+        try:
+            job = Job.fetch(job_id, connection=redis_conn)
+        except NoSuchJobError:
+            return jsonify({"error": "Job not found"}), 404
+        
+        status = job.get_status()
+        if status == 'failed':
+            return jsonify({"job_id": job_id, "status": status, "error": "Video rendering failed"}), 500
+        
+        if status == 'finished':
+            return jsonify({"error": "Result expired, resubmit the request"}), 404
+        
+        return jsonify({"job_id": job_id, "status": status}), 202
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -104,30 +491,27 @@ def text_to_speech_only():
         if not text:
             return jsonify({"error": "Text is required"}), 400
         
-        # Generate voiceover
-        tts = text_to_speech(text, lang)
+        if not isinstance(text, str) or not isinstance(lang, str):
+            return jsonify({"error": "Text and language must be strings"}), 400
         
-        # Save to temporary file
-        temp_dir = tempfile.mkdtemp()
-        try:
-            audio_path = os.path.join(temp_dir, "output.mp3")
-            tts.save(audio_path)
-            
-            # Read audio file and convert to base64
-            with open(audio_path, 'rb') as f:
-                audio_bytes = f.read()
-                audio_base64 = base64.b64encode(audio_bytes).decode()
-            
-            return jsonify({
-                "text": text,
-                "language": lang,
-                "audio_base64": audio_base64,
-                "status": "success"
-            })
-            
-        finally:
-            import shutil
-            shutil.rmtree(temp_dir)
+        if len(text) > MAX_TEXT_LENGTH:
+            return jsonify({"error": f"Text is limited to {MAX_TEXT_LENGTH} characters"}), 413
+        
+        # MP3 is returned as-is by default; ?format=json keeps the base64 envelope
+        response_format = request.args.get('format', 'mp3')
+        if response_format not in ('mp3', 'json'):
+            return jsonify({"error": f"Unsupported format: {response_format}"}), 400
+        
+        audio_path = speech_file(text, lang)
+        
+        if response_format == 'json':
+            return Response(
+                file_base64_json_stream({"text": text, "language": lang, "status": "success"}, "audio_base64", audio_path),
+                mimetype='application/json'
+            )
+        
+        # Send the cached MP3 by path so the server can use sendfile(2)
+        return send_file(audio_path, mimetype='audio/mpeg', download_name='speech.mp3')
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500